@@ -1,12 +1,31 @@
 """API server for RAG on portfolio/resume using FastAPI, OpenAI, and MongoDB."""
 import os
-import math
+import json
+import time
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
 from typing import List, Optional
+import httpx
+import numpy as np
+from cachetools import TTLCache
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from pymongo import MongoClient
-from openai import OpenAI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from bson.binary import Binary, BinaryVectorDtype, VECTOR_SUBTYPE
+from pymongo import AsyncMongoClient
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+try:  # optional: JIT-compiled scoring kernel for int8 fallback matrices
+    from numba import njit, prange
+except ImportError:  # pragma: no cover - numba is not a hard dependency
+    njit = None
+
+try:  # optional: approximate nearest-neighbour index for large corpora
+    import hnswlib
+except ImportError:  # pragma: no cover - hnswlib is not a hard dependency
+    hnswlib = None
 
 
 # --- Environment / config ---
@@ -17,19 +36,83 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 EMBED_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
 CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
 TOP_K = int(os.getenv("TOP_K", "4"))
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "5"))
+MONGODB_COMPRESSORS = os.getenv("MONGODB_COMPRESSORS", "zstd,zlib")
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "vector_index")  # Atlas Vector Search index name
+VECTOR_CANDIDATES_PER_K = int(os.getenv("VECTOR_CANDIDATES_PER_K", "10"))
+CORPUS_TTL = float(os.getenv("CORPUS_TTL", "60"))  # seconds between freshness checks
+# float32 | int8 (needs numba); int8 applies to the exact scan only, not the HNSW path
+FALLBACK_DTYPE = os.getenv("FALLBACK_DTYPE", "float32")
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "5000"))  # below this an exact scan is faster
+ANN_EF = int(os.getenv("ANN_EF", "64"))  # HNSW query-time breadth (recall vs latency)
+CONTEXT_CHARS = int(os.getenv("CONTEXT_CHARS", "200"))  # per-source text sent to the chat model
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "600"))  # seconds
 
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY must be set in environment")
 if not MONGODB_URI:
     raise RuntimeError("MONGODB_URI must be set in environment")
+if FALLBACK_DTYPE not in ("float32", "int8"):
+    raise RuntimeError("FALLBACK_DTYPE must be float32 or int8")
+if FALLBACK_DTYPE == "int8" and njit is None:
+    raise RuntimeError("FALLBACK_DTYPE=int8 requires numba")
 
 # --- Clients ---
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-mongo_client = MongoClient(MONGODB_URI)
+# one long-lived pool per worker: HTTP/2 multiplexes embedding + chat calls and
+# keep-alive avoids a TCP/TLS handshake per request
+openai_client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_CONNECTIONS // 2,
+        ),
+        timeout=30,
+    ),
+)
+mongo_client = AsyncMongoClient(
+    MONGODB_URI,
+    maxPoolSize=MONGODB_MAX_POOL_SIZE,
+    minPoolSize=MONGODB_MIN_POOL_SIZE,
+    serverSelectionTimeoutMS=3000,
+    socketTimeoutMS=5000,
+    compressors=MONGODB_COMPRESSORS,
+)
 coll = mongo_client[MONGODB_DB][MONGODB_COLL]
 
+# --- Prompt ---
+SYSTEM_PROMPT = (
+    "You are a concise, factual assistant that answers questions about Satya's resume and portfolio. "
+    "Use only the provided CONTEXT to form your answers; do not rely on external knowledge except for "
+    "very brief clarifications. If the information is not present in the CONTEXT, respond with "
+    "\"I don't know\" or a brief honest statement (e.g. \"I don't have that information in the provided context\"). "
+    "Be concise and clear: prefer short paragraphs or bullet points and avoid speculation. "
+    "Do not include raw source text longer than 200 characters; summarize and cite the source instead. "
+    "If the user requests actionable changes (for example, resume edits), give step-by-step, prioritized suggestions. "
+    "If the user's question is ambiguous, ask one clear clarifying question. "
+    "Respect privacy: do not invent contact details, personal identifiers, or confidential data."
+)
+SYSTEM_MSG = {"role": "system", "content": SYSTEM_PROMPT}
+
 # --- FastAPI app ---
-app = FastAPI(title="RAG API for Portfolio")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Per-worker startup: warm the scoring kernel and materialize the fallback corpus."""
+    warm_scoring_kernel()
+    try:
+        await corpus.refresh(force=True)
+    except Exception:
+        pass  # retried lazily by the fallback path
+    yield
+
+
+app = FastAPI(title="RAG API for Portfolio", lifespan=lifespan)
 
 # CORS: tighten this in production
 allow_origins = os.getenv("CORS_ALLOW_ORIGINS", "*")
@@ -51,7 +134,8 @@ app.add_middleware(
 class QueryRequest(BaseModel):
     """Request model for /api/query."""
     q: str
-    k: Optional[int] = None
+    k: Optional[int] = Field(None, ge=1, le=100)
+    stream: bool = False  # sources JSON line, answer text, then a JSON status line
 
 
 class Source(BaseModel):
@@ -69,16 +153,330 @@ class QueryResponse(BaseModel):
 
 
 # --- Helpers ---
-def cosine_sim(a: List[float], b: List[float]) -> float:
-    """Compute cosine similarity between two vectors."""
-    if not a or not b or len(a) != len(b):
-        return 0.0
-    dot = sum(x * y for x, y in zip(a, b))
-    na = math.sqrt(sum(x * x for x in a))
-    nb = math.sqrt(sum(y * y for y in b))
-    if na == 0 or nb == 0:
-        return 0.0
-    return dot / (na * nb)
+def embedding_array(value) -> Optional[np.ndarray]:
+    """View a stored embedding as a float32 array.
+
+    Binary embeddings (a BSON float32 vector, or raw packed float32 bytes) are
+    wrapped with ``np.frombuffer`` without creating per-element Python floats;
+    legacy arrays of numbers are converted. Returns None if nothing usable is stored.
+    """
+    if isinstance(value, Binary) and value.subtype == VECTOR_SUBTYPE:
+        # 2-byte header: dtype tag + padding bits
+        if value[:1] != BinaryVectorDtype.FLOAT32.value:
+            return None
+        return np.frombuffer(value, dtype=np.float32, offset=2)
+    if isinstance(value, bytes):
+        return np.frombuffer(value, dtype=np.float32)
+    if value:
+        return np.asarray(value, dtype=np.float32)
+    return None
+
+
+def build_matrix(docs: List[dict]):
+    """Stack document embeddings (unit-norm, as written by the indexer) into a float32 matrix.
+
+    Documents without an embedding (or with a mismatched dimension) are dropped;
+    returns the kept documents (without their embeddings) alongside the matrix
+    so rows stay aligned.
+    """
+    vectors = [(d, embedding_array(d.get("embedding"))) for d in docs]
+    vectors = [(d, v) for d, v in vectors if v is not None and v.size]
+    if not vectors:
+        return [], np.empty((0, 0), dtype=np.float32)
+    dim = vectors[0][1].shape[0]
+    vectors = [(d, v) for d, v in vectors if v.shape[0] == dim]
+    rows = [{"id": d.get("id"), "text": d.get("text"), "meta": d.get("meta")} for d, _ in vectors]
+    matrix = np.stack([v for _, v in vectors])
+    return rows, matrix
+
+
+if njit is not None:
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _scores_kernel(matrix, q, out):
+        """Dot every row of an int8 ``matrix`` with ``q`` into ``out``, without upcast copies."""
+        for i in prange(matrix.shape[0]):
+            s = 0.0
+            for j in range(matrix.shape[1]):
+                s += matrix[i, j] * q[j]
+            out[i] = s
+
+else:
+    _scores_kernel = None
+
+
+def quantize_matrix(matrix: np.ndarray, dtype: str = FALLBACK_DTYPE):
+    """Store a normalized float32 matrix as ``dtype``.
+
+    Returns ``(stored, scale)``; ``scale`` holds the per-row int8 step size and
+    is None for float32.
+    """
+    if dtype == "int8":
+        scale = np.abs(matrix).max(axis=1) / 127.0 if matrix.size else np.ones(0)
+        scale[scale == 0] = 1.0
+        stored = np.round(matrix / scale[:, None]).astype(np.int8)
+        return stored, scale.astype(np.float32)
+    return matrix, None
+
+
+def score_rows(matrix: np.ndarray, q: np.ndarray, scale: Optional[np.ndarray] = None) -> np.ndarray:
+    """Similarity of every row of ``matrix`` to the unit query vector ``q``.
+
+    float32 rows go through BLAS; int8 rows are read in place by the numba kernel.
+    """
+    if matrix.dtype == np.float32:
+        out = matrix @ q  # BLAS sgemv beats the numba kernel here
+    else:
+        out = np.empty(matrix.shape[0], dtype=np.float32)
+        _scores_kernel(matrix, q, out)
+    if scale is not None:
+        out *= scale
+    return out
+
+
+def warm_scoring_kernel():
+    """Compile the numba kernel up front so the first fallback query doesn't pay for it."""
+    if _scores_kernel is not None and FALLBACK_DTYPE == "int8":
+        _scores_kernel(
+            np.zeros((1, 1), dtype=np.int8),
+            np.zeros(1, dtype=np.float32),
+            np.empty(1, dtype=np.float32),
+        )
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return indices of the k highest scores, best first."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < scores.shape[0]:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(scores.shape[0])
+    return idx[np.argsort(-scores[idx])]
+
+
+def build_ann_index(matrix: np.ndarray):
+    """HNSW index over the unit rows of ``matrix``.
+
+    Returns None when hnswlib is unavailable or the corpus is small enough
+    that the exact scan is cheaper.
+    """
+    if hnswlib is None or matrix.shape[0] < ANN_MIN_ROWS:
+        return None
+    index = hnswlib.Index(space="ip", dim=matrix.shape[1])
+    index.init_index(max_elements=matrix.shape[0], ef_construction=200, M=16)
+    index.add_items(matrix, np.arange(matrix.shape[0]))
+    index.set_ef(ANN_EF)
+    return index
+
+
+class Corpus:
+    """In-memory copy of the indexed chunks, used by the fallback scan.
+
+    The embedding matrix is materialized once and reloaded only when the
+    collection changes, so fallback queries make no Mongo round-trips.
+    ``epoch`` increases whenever a change is detected and keys the answer cache.
+    """
+
+    def __init__(self):
+        self.rows: List[dict] = []
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.scale: Optional[np.ndarray] = None
+        self.ann = None
+        self.signature = None  # collection fingerprint as last seen
+        self.loaded = None  # fingerprint the in-memory rows were built from
+        self.epoch = 0
+        self.checked_at = 0.0
+        self._reload_lock = asyncio.Lock()  # one reload at a time, shared by waiters
+
+    async def _current_signature(self):
+        """Cheap fingerprint of the collection: document count + newest indexedAt."""
+        latest = await coll.find_one({}, {"_id": 0, "indexedAt": 1}, sort=[("indexedAt", -1)])
+        return await coll.estimated_document_count(), (latest or {}).get("indexedAt")
+
+    async def load(self):
+        """Read every chunk and rebuild the embedding matrix."""
+        cursor = coll.find({}, {"_id": 0, "id": 1, "text": 1, "meta": 1, "embedding": 1})
+        docs = await cursor.to_list(length=None)
+        rows, matrix = build_matrix(docs)
+        # graph construction is CPU-heavy; keep it off the event loop
+        ann = await asyncio.to_thread(build_ann_index, matrix)
+        self.rows, self.ann = rows, ann
+        if ann is None:
+            self.matrix, self.scale = quantize_matrix(matrix)
+        else:
+            # searches go through hnswlib's own float32 copy; quantizing would only add memory
+            self.matrix, self.scale = matrix, None
+
+    async def check(self, force: bool = False):
+        """Fingerprint the collection at most every CORPUS_TTL seconds; bump epoch on change."""
+        now = time.monotonic()
+        if not force and now - self.checked_at < CORPUS_TTL:
+            return
+        self.checked_at = now  # also throttles retries while Mongo is unreachable
+        signature = await self._current_signature()
+        if signature != self.signature:
+            self.signature = signature
+            self.epoch += 1
+            query_cache.clear()  # cached answers may cite chunks that changed
+
+    async def refresh(self, force: bool = False):
+        """Reload the in-memory rows if the collection changed since they were built."""
+        await self.check(force)
+        if not force and self.loaded == self.signature:
+            return
+        async with self._reload_lock:
+            # a concurrent request may have finished this reload while we waited
+            if not force and self.loaded == self.signature:
+                return
+            signature = self.signature
+            await self.load()
+            self.loaded = signature
+
+    def search(self, emb: List[float], k: int) -> List[dict]:
+        """Return the k rows most similar to ``emb``, best first."""
+        q_vec = np.asarray(emb, dtype=np.float32)
+        q_norm = np.linalg.norm(q_vec)
+        if not self.matrix.shape[0] or self.matrix.shape[1] != q_vec.shape[0] or not q_norm:
+            return []
+        q_vec /= q_norm
+        k = min(k, self.matrix.shape[0])
+        if self.ann is not None:
+            self.ann.set_ef(max(ANN_EF, k))
+            labels, dists = self.ann.knn_query(q_vec, k=k)
+            hits = zip(labels[0], 1.0 - dists[0])
+        else:
+            scores = score_rows(self.matrix, q_vec, self.scale)
+            hits = ((i, scores[i]) for i in top_k_indices(scores, k))
+        return [
+            {
+                "id": self.rows[i].get("id"),
+                "text": self.rows[i].get("text"),
+                "meta": self.rows[i].get("meta"),
+                "score": float(score),
+            }
+            for i, score in hits
+        ]
+
+
+corpus = Corpus()
+
+
+def normalize_query(q: str) -> str:
+    """Canonical form of a query used as the exact-match cache key."""
+    return " ".join(q.lower().split())
+
+
+class QueryCache:
+    """Bounded cache of query embeddings and the answers produced for them.
+
+    An exact (normalized) text hit skips the embedding call; a fresh embedding
+    within ``threshold`` cosine of a different cached query with the same k
+    reuses that query's answer (exact repeats are left to the TTL'd answer cache). When full, the least-hit entry is evicted, oldest first.
+    """
+
+    def __init__(self, maxsize: int, threshold: float):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.slots: dict = {}  # normalized query -> row in matrix/entries
+        self.entries: List[Optional[dict]] = [None] * maxsize
+        self.matrix: Optional[np.ndarray] = None  # unit query embeddings, one row per slot
+        self.ks = np.zeros(maxsize, dtype=np.int64)  # k of the cached answer per slot
+
+    def _touch(self, entry: dict):
+        entry["hits"] += 1
+        entry["used"] = time.monotonic()
+
+    def _free_slot(self) -> int:
+        for i, entry in enumerate(self.entries):
+            if entry is None:
+                return i
+        victim = min(
+            range(self.maxsize),
+            key=lambda i: (self.entries[i]["hits"], self.entries[i]["used"]),
+        )
+        del self.slots[self.entries[victim]["key"]]
+        return victim
+
+    def embedding(self, key: str) -> Optional[List[float]]:
+        """Embedding previously computed for exactly this query, if any."""
+        slot = self.slots.get(key)
+        if slot is None:
+            return None
+        entry = self.entries[slot]
+        self._touch(entry)
+        return entry["embedding"]
+
+    def similar(self, emb: List[float], k: int, exclude: Optional[str] = None) -> Optional[dict]:
+        """Cached response for a query semantically equivalent to ``emb``, other than ``exclude``."""
+        if self.matrix is None or self.matrix.shape[1] != len(emb):
+            return None
+        q_vec = np.asarray(emb, dtype=np.float32)
+        q_norm = np.linalg.norm(q_vec)
+        if not q_norm:
+            return None
+        scores = self.matrix @ (q_vec / q_norm)
+        scores[self.ks != k] = -1.0
+        if exclude in self.slots:
+            scores[self.slots[exclude]] = -1.0
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        entry = self.entries[best]
+        self._touch(entry)
+        return entry["response"]
+
+    def put(self, key: str, emb: List[float], k: int, response: dict):
+        """Remember the embedding and response for a query."""
+        if self.maxsize <= 0:
+            return
+        q_vec = np.asarray(emb, dtype=np.float32)
+        q_norm = np.linalg.norm(q_vec)
+        if self.matrix is None or self.matrix.shape[1] != q_vec.shape[0]:
+            self.clear()
+            self.matrix = np.zeros((self.maxsize, q_vec.shape[0]), dtype=np.float32)
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = self._free_slot()
+            self.slots[key] = slot
+        self.matrix[slot] = q_vec / q_norm if q_norm else 0.0
+        self.ks[slot] = k
+        self.entries[slot] = {
+            "key": key,
+            "embedding": emb,
+            "response": response,
+            "hits": 0,
+            "used": time.monotonic(),
+        }
+
+    def clear(self):
+        """Drop every cached entry."""
+        self.slots.clear()
+        self.entries = [None] * self.maxsize
+        self.matrix = None
+        self.ks[:] = 0
+
+
+query_cache = QueryCache(QUERY_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD)
+answer_cache = TTLCache(maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
+
+
+def answer_key(cache_key: str, k: int, epoch: int) -> bytes:
+    """Answer-cache key for a normalized query, k and corpus epoch."""
+    return hashlib.blake2b(f"{epoch}:{k}:{cache_key}".encode("utf-8"), digest_size=16).digest()
+
+
+def remember(cache_key: str, emb: List[float], k: int, epoch: int, response: dict):
+    """Store a finished response in both the semantic and the exact answer cache.
+
+    ``epoch`` is the corpus epoch the response was retrieved under; if the
+    corpus changed while it was being generated the response is not cached.
+    """
+    if corpus.epoch != epoch:
+        return
+    query_cache.put(cache_key, emb, k, response)
+    answer_cache[answer_key(cache_key, k, epoch)] = response
 
 
 def normalize_result(r):
@@ -91,6 +489,81 @@ def normalize_result(r):
     }
 
 
+def unique_sources(results: List[dict]) -> List[dict]:
+    """Normalize results, keeping only the first (best-ranked) hit per id."""
+    seen = set()
+    sources = []
+    for r in results:
+        src = normalize_result(r)
+        if src["id"] in seen:
+            continue
+        seen.add(src["id"])
+        sources.append(src)
+    return sources
+
+
+def snippet(text: str, limit: int = CONTEXT_CHARS) -> str:
+    """Truncate source text for the prompt, marking the cut."""
+    return text[:limit] + ("…" if len(text) > limit else "")
+
+
+def build_messages(q: str, sources: List[dict]) -> List[dict]:
+    """Chat messages for a query: system prompt, retrieved context, user question."""
+    context_parts = [
+        f"SOURCE {i+1} (score:{s['score']:.4f}):\n{snippet(s['text'])}"
+        for i, s in enumerate(sources)
+    ]
+    return [
+        SYSTEM_MSG,
+        {"role": "system", "content": "CONTEXT:\n" + "\n\n---\n\n".join(context_parts)},
+        {"role": "user", "content": q},
+    ]
+
+
+async def stream_answer(sources: List[dict], tokens, on_complete=None):
+    """Streamed response body: the sources as one JSON line, then the answer text.
+
+    The body always ends with a JSON status line, ``{"status": "ok"}`` or
+    ``{"status": "error", "detail": ...}``, so a client can tell a complete
+    answer from one cut short by an upstream failure.
+    """
+    yield json.dumps({"sources": sources}) + "\n"
+    parts = []
+    try:
+        async for token in tokens:
+            parts.append(token)
+            yield token
+    except Exception as e:
+        detail = f"Chat completion error: {str(e)}"
+        yield "\n" + json.dumps({"status": "error", "detail": detail}) + "\n"
+        return
+    yield "\n" + json.dumps({"status": "ok"}) + "\n"
+    if on_complete is not None:
+        on_complete("".join(parts))
+
+
+async def chat_deltas(chat_stream):
+    """Text deltas of a streamed chat completion."""
+    async for chunk in chat_stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def replay(text: str):
+    """Stream an already complete answer."""
+    yield text
+
+
+def cached_response(response: dict, stream: bool):
+    """Serve a cached response in the shape the client asked for."""
+    if stream:
+        return StreamingResponse(
+            stream_answer(response["sources"], replay(response["answer"])),
+            media_type="text/plain; charset=utf-8",
+        )
+    return response
+
+
 @app.get('/')
 async def health_check():
     """Health check endpoint."""
@@ -114,84 +587,93 @@ async def query_rag(req: QueryRequest):
     if not q:
         raise HTTPException(status_code=400, detail="q is required")
 
-    # 1) embed the query
+    # 0) exact repeat of a recent query against the same corpus: nothing to compute
+    cache_key = normalize_query(q)
     try:
-        emb_resp = openai_client.embeddings.create(model=EMBED_MODEL, input=q)
-        # support new client response shape
-        emb = (
-            emb_resp.data[0].embedding
-            if hasattr(emb_resp, "data")
-            else emb_resp["data"][0]["embedding"]
-        )
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Embedding error: {str(e)}")
+        await corpus.check()
+    except Exception:
+        pass  # keep serving with the last known epoch
+    epoch = corpus.epoch
+    cached = answer_cache.get(answer_key(cache_key, k, epoch))
+    if cached is not None:
+        return cached_response(cached, req.stream)
+
+    # 1) embed the query (reusing the embedding of an identical earlier query)
+    emb = query_cache.embedding(cache_key)
+    if emb is None:
+        try:
+            emb_resp = await openai_client.embeddings.create(model=EMBED_MODEL, input=q)
+            # support new client response shape
+            emb = (
+                emb_resp.data[0].embedding
+                if hasattr(emb_resp, "data")
+                else emb_resp["data"][0]["embedding"]
+            )
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Embedding error: {str(e)}")
+
+    # a different but semantically equivalent query was already answered
+    cached = query_cache.similar(emb, k, exclude=cache_key)
+    if cached is not None:
+        return cached_response(cached, req.stream)
 
-    # 2) try Atlas vector search ($search / knnBeta). fallback to scanning & cosine.
+    # 2) try Atlas $vectorSearch. fallback to scanning & cosine.
     results = []
     try:
-        # prefer $vectorSearch/$search with knnBeta — choose syntax available in your Atlas
         pipeline = [
-            {"$search": {"index": "index", "knnBeta": {"vector": emb, "path": "embedding", "k": k}}},
+            {
+                "$vectorSearch": {
+                    "index": VECTOR_INDEX,
+                    "path": "embedding",
+                    "queryVector": emb,
+                    # candidate pool scanned by HNSW: the recall vs latency knob
+                    "numCandidates": max(VECTOR_CANDIDATES_PER_K * k, 100),
+                    "limit": k,
+                }
+            },
             {
                 "$project": {
                     "_id": 0,
                     "id": 1,
                     "text": 1,
                     "meta": 1,
-                    "score": {"$meta": "searchScore"},
+                    "score": {"$meta": "vectorSearchScore"},
                 }
             },
-            {"$limit": k},
         ]
-        cursor = coll.aggregate(pipeline)
-        results = list(cursor)
+        cursor = await coll.aggregate(pipeline)
+        results = await cursor.to_list(length=k)
     except Exception:
-        # fallback: compute cosine similarity across documents (fine for small dataset)
-        docs = list(coll.find({}, {"id": 1, "text": 1, "meta": 1, "embedding": 1}))
-        scored = []
-        for d in docs:
-            score = cosine_sim(emb, d.get("embedding") or [])
-            scored.append(
-                {
-                    "id": d.get("id"),
-                    "text": d.get("text"),
-                    "meta": d.get("meta"),
-                    "score": score,
-                }
-            )
-        scored.sort(key=lambda x: x["score"], reverse=True)
-        results = scored[:k]
+        # fallback: cosine similarity over the in-memory corpus (fine for small dataset)
+        await corpus.refresh()
+        results = corpus.search(emb, k)
 
-    # normalize results
-    sources = [normalize_result(r) for r in results]
+    # normalize results, dropping duplicate ids
+    sources = unique_sources(results)
 
     # 3) assemble context and call chat completion
-    context_text = "\n\n---\n\n".join(
-        [
-            f"SOURCE {i+1} (score:{s['score']:.4f}):\n{s['text']}"
-            for i, s in enumerate(sources)
-        ]
-    )
-    system_prompt = (
-        "You are a concise, factual assistant that answers questions about Satya's resume and portfolio. "
-        "Use only the provided CONTEXT to form your answers; do not rely on external knowledge except for "
-        "very brief clarifications. If the information is not present in the CONTEXT, respond with "
-        "\"I don't know\" or a brief honest statement (e.g. \"I don't have that information in the provided context\"). "
-        "Be concise and clear: prefer short paragraphs or bullet points and avoid speculation. "
-        "Do not include raw source text longer than 200 characters; summarize and cite the source instead. "
-        "If the user requests actionable changes (for example, resume edits), give step-by-step, prioritized suggestions. "
-        "If the user's question is ambiguous, ask one clear clarifying question. "
-        "Respect privacy: do not invent contact details, personal identifiers, or confidential data."
-    )
-
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "system", "content": f"CONTEXT:\n{context_text}"},
-        {"role": "user", "content": q},
-    ]
+    messages = build_messages(q, sources)
+
+    if req.stream:
+        try:
+            chat_stream = await openai_client.chat.completions.create(
+                model=CHAT_MODEL, messages=messages, max_tokens=600, temperature=0.0, stream=True
+            )
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Chat completion error: {str(e)}")
+        return StreamingResponse(
+            stream_answer(
+                sources,
+                chat_deltas(chat_stream),
+                lambda answer: remember(
+                    cache_key, emb, k, epoch, {"answer": answer, "sources": sources}
+                ),
+            ),
+            media_type="text/plain; charset=utf-8",
+        )
 
     try:
-        chat_resp = openai_client.chat.completions.create(
+        chat_resp = await openai_client.chat.completions.create(
             model=CHAT_MODEL, messages=messages, max_tokens=600, temperature=0.0
         )
         # support different response shapes
@@ -207,4 +689,6 @@ async def query_rag(req: QueryRequest):
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Chat completion error: {str(e)}")
 
-    return {"answer": answer, "sources": sources}
+    response = {"answer": answer, "sources": sources}
+    remember(cache_key, emb, k, epoch, response)
+    return response
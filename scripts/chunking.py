@@ -0,0 +1,37 @@
+"""Text chunking for the portfolio indexer (kept free of I/O so it can be tested)."""
+import re
+from bisect import bisect_left
+from typing import List
+
+
+def chunk_text(s: str, chunk_size: int = 800, overlap: int = 200) -> List[str]:
+    """Split ``s`` into chunks of at most ``chunk_size`` characters.
+
+    Breaks fall on a space when one lies in the second half of the window;
+    consecutive chunks share about ``overlap`` characters and each starts on a
+    word boundary.
+    """
+    s = s.strip()
+    if len(s) <= chunk_size:
+        return [s]
+    # word-break candidates, found in a single scan instead of an rfind per window
+    spaces = [m.start() for m in re.finditer(" ", s)]
+    parts = []
+    i = 0
+    n = len(s)
+    while i < n:
+        end = i + chunk_size
+        if end < n:
+            j = bisect_left(spaces, end) - 1  # last space before end
+            if j >= 0 and spaces[j] > i + (chunk_size // 2):
+                end = spaces[j]
+        parts.append(s[i:end].strip())
+        if end >= n:
+            break
+        # step back by `overlap` (always moving forward), then on to the next word start
+        nxt = max(end - overlap, i + 1)
+        j = bisect_left(spaces, nxt - 1)
+        if j < len(spaces) and spaces[j] < end:
+            nxt = spaces[j] + 1
+        i = nxt
+    return parts
@@ -1,16 +1,21 @@
 # index_portfolio_fixed.py
-# pip install pymongo openai python-dotenv
+# pip install "pymongo>=4.10" openai python-dotenv tiktoken numpy
 import os
 import json
 import time
-import math
+import asyncio
 import hashlib
 from typing import List
+import numpy as np
+import tiktoken
+from bson.binary import Binary, BinaryVectorDtype
 from pymongo import MongoClient, UpdateOne
 from dotenv import load_dotenv
 
+from chunking import chunk_text
+
 # modern openai client
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 load_dotenv()
 
@@ -19,9 +24,12 @@ MONGO_DB = os.environ.get("MONGODB_DB", "portfolio")
 MONGO_COLL = os.environ.get("MONGODB_COLL", "portfolio_chunks")
 OPENAI_KEY = os.environ["OPENAI_API_KEY"]
 EMBED_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
-BATCH_SIZE = int(os.environ.get("BATCH_SIZE", "8"))
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", "2048"))  # max inputs per request
+MAX_BATCH_TOKENS = int(os.environ.get("MAX_BATCH_TOKENS", "250000"))  # API cap is 300k
 CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", "800"))  # characters
 CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", "200"))
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", "5"))  # batches in flight
+EMBED_MAX_RETRIES = int(os.environ.get("EMBED_MAX_RETRIES", "6"))
 
 if not OPENAI_KEY:
     raise SystemExit("OPENAI_API_KEY required in environment")
@@ -32,7 +40,14 @@ db = mongo_client[MONGO_DB]
 coll = db[MONGO_COLL]
 
 # --- OpenAI client (distinct name) ---
-openai_client = OpenAI(api_key=OPENAI_KEY)
+# the SDK retries 429/5xx/timeouts with jittered backoff, honouring Retry-After
+openai_client = AsyncOpenAI(api_key=OPENAI_KEY, max_retries=EMBED_MAX_RETRIES)
+
+# tokenizer used to pack embedding requests by token budget
+try:
+    encoding = tiktoken.encoding_for_model(EMBED_MODEL)
+except KeyError:
+    encoding = tiktoken.get_encoding("cl100k_base")
 
 # load portfolio JSON (adjust path)
 with open("portfolio.json", "r", encoding="utf-8") as f:
@@ -40,24 +55,6 @@ with open("portfolio.json", "r", encoding="utf-8") as f:
 
 
 # ---------- helpers ----------
-def chunk_text(s: str, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP) -> List[str]:
-    s = s.strip()
-    if len(s) <= chunk_size:
-        return [s]
-    parts = []
-    i = 0
-    n = len(s)
-    while i < n:
-        end = i + chunk_size
-        if end < n:
-            last_space = s.rfind(" ", i, end)
-            if last_space > i + (chunk_size // 2):
-                end = last_space
-        parts.append(s[i:end].strip())
-        i = max(end - overlap, end)
-    return parts
-
-
 def collect_text_parts(data: dict) -> List[dict]:
     parts = []
     p = data.get("personal", {})
@@ -187,13 +184,13 @@ def text_to_id(text: str) -> str:
 
 
 # Robust embed_batch supporting new/old SDK shapes
-def embed_batch(inputs: List[str]) -> List[List[float]]:
+async def embed_batch(inputs: List[str]) -> List[List[float]]:
     """
     Returns list of embedding vectors aligned with inputs.
     Uses openai_client.embeddings.create(...)
     """
     # call embeddings
-    resp = openai_client.embeddings.create(model=EMBED_MODEL, input=inputs)
+    resp = await openai_client.embeddings.create(model=EMBED_MODEL, input=inputs)
 
     # resp may be an object with .data or a dict; handle both
     data = None
@@ -216,14 +213,46 @@ def embed_batch(inputs: List[str]) -> List[List[float]]:
     return embeddings
 
 
+def pack_batches(
+    docs: List[dict], max_inputs=BATCH_SIZE, max_tokens=MAX_BATCH_TOKENS
+) -> List[List[dict]]:
+    """Greedily group docs into batches under both the input and token limits."""
+    token_counts = [len(t) for t in encoding.encode_ordinary_batch([d["text"] for d in docs])]
+    batches, current, current_tokens = [], [], 0
+    for d, n in zip(docs, token_counts):
+        if current and (len(current) >= max_inputs or current_tokens + n > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(d)
+        current_tokens += n
+    if current:
+        batches.append(current)
+    return batches
+
+
+def normalize_rows(embeddings: List[List[float]]) -> np.ndarray:
+    """Scale each embedding to unit length so cosine similarity is a plain dot."""
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    return vectors
+
+
+def to_bson_vector(embedding) -> Binary:
+    """Pack an embedding as a BSON float32 vector (half the size of an array of doubles)."""
+    return Binary.from_vector(
+        np.asarray(embedding, dtype=np.float32).tolist(), BinaryVectorDtype.FLOAT32
+    )
+
+
 def upsert_chunks(chunks):
     ops = []
     for c in chunks:
+        emb = c.get("embedding")
         doc = {
             "id": c["id"],
             "text": c["text"],
             "meta": c.get("meta", {}),
-            "embedding": c.get("embedding"),
+            "embedding": to_bson_vector(emb) if emb is not None else None,
             "indexedAt": c.get("indexedAt")
             or time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
         }
@@ -235,7 +264,18 @@ def upsert_chunks(chunks):
 
 
 # ---------- main ----------
-def main():
+async def embed_and_store(n: int, total: int, batch: List[dict], sem: asyncio.Semaphore):
+    """Embed one batch (bounded by ``sem``) and upsert it."""
+    inputs = [d["text"] for d in batch]
+    async with sem:
+        print(f"Embedding batch {n + 1}/{total} size {len(inputs)}")
+        embeddings = await embed_batch(inputs)
+    for j, vec in enumerate(normalize_rows(embeddings)):
+        batch[j]["embedding"] = vec
+    await asyncio.to_thread(upsert_chunks, batch)
+
+
+async def main():
     parts = collect_text_parts(portfolio)
     docs = []
     for p in parts:
@@ -247,20 +287,14 @@ def main():
             docs.append({"id": _id, "text": sc, "meta": chunk_meta})
     print(f"Prepared {len(docs)} chunks")
 
-    for i in range(0, len(docs), BATCH_SIZE):
-        batch = docs[i : i + BATCH_SIZE]
-        inputs = [d["text"] for d in batch]
-        print(
-            f"Embedding batch {i//BATCH_SIZE + 1}/{math.ceil(len(docs)/BATCH_SIZE)} size {len(inputs)}"
-        )
-        embeddings = embed_batch(inputs)
-        for j, emb in enumerate(embeddings):
-            batch[j]["embedding"] = emb
-        upsert_chunks(batch)
-        time.sleep(0.5)
+    batches = pack_batches(docs)
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+    await asyncio.gather(
+        *(embed_and_store(n, len(batches), b, sem) for n, b in enumerate(batches))
+    )
 
     print("Indexing complete")
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
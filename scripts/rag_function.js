@@ -10,7 +10,7 @@ exports = async function(payload, response) {
       response.setStatusCode(400);
       return { error: "q required" };
     }
-    const k = body.k ? parseInt(body.k, 10) : 4;
+    const k = Math.min(Math.max(body.k ? parseInt(body.k, 10) || 4 : 4, 1), 100);
 
     const OPENAI_KEY = context.values.get("OPENAI_API_KEY");
     if (!OPENAI_KEY) {
@@ -35,20 +35,20 @@ exports = async function(payload, response) {
     if (!qEmb) throw new Error("embedding failed");
 
     // 2) run Atlas Search KNN
-    // Update `your_db_name` and `chunks` if different; make sure a Search index exists mapping `embedding` as vector
+    // Update `your_db_name` and `chunks` if different; make sure a Vector Search index exists on `embedding`
     const coll = context.services.get("mongodb-atlas").db(context.values.get("MONGODB_DB") || "resume_rag").collection(context.values.get("MONGODB_COLL") || "chunks");
 
-    // Try a $search aggregation (knnBeta / $vectorSearch depending on atlas version)
+    // Try $vectorSearch (embeddings are stored as BSON float32 vectors)
     let results = [];
     try {
       const pipeline = [
         {
-          $search: {
-            knnBeta: {
-              vector: qEmb,
-              path: "embedding",
-              k: k
-            }
+          $vectorSearch: {
+            index: context.values.get("VECTOR_INDEX") || "vector_index",
+            path: "embedding",
+            queryVector: qEmb,
+            numCandidates: Math.max(10 * k, 100),
+            limit: k
           }
         },
         {
@@ -57,22 +57,35 @@ exports = async function(payload, response) {
             id: "$id",
             text: 1,
             meta: 1,
-            score: { $meta: "searchScore" }
+            score: { $meta: "vectorSearchScore" }
           }
-        },
-        { $limit: k }
+        }
       ];
       results = await coll.aggregate(pipeline).toArray();
     } catch (err) {
       // fallback: compute cosine similarity in JS across collection (safe for small datasets)
       const docs = await coll.find({}, { projection: { id: 1, text: 1, meta: 1, embedding: 1 } }).toArray();
+      // embeddings are BinData subtype 9: a 2-byte header (dtype 0x27 = float32, padding)
+      // followed by little-endian float32 values; legacy documents hold plain arrays
+      function toFloats(v) {
+        if (!v) return null;
+        if (Array.isArray(v)) return v;
+        const bytes = v.buffer
+          ? Buffer.from(v.buffer)
+          : Buffer.from(v.toBase64 ? v.toBase64() : v.base64(), "base64");
+        if (bytes.length < 2 || bytes[0] !== 0x27) return null;
+        const out = new Array((bytes.length - 2) >> 2);
+        for (let i = 0; i < out.length; i++) out[i] = bytes.readFloatLE(2 + 4 * i);
+        return out;
+      }
       function cosine(a, b) {
+        if (!b || a.length !== b.length) return 0;
         let dot = 0, na = 0, nb = 0;
         for (let i = 0; i < a.length; i++) { dot += a[i]*b[i]; na += a[i]*a[i]; nb += b[i]*b[i]; }
         if (na === 0 || nb === 0) return 0;
         return dot / (Math.sqrt(na)*Math.sqrt(nb));
       }
-      const scored = docs.map(d => ({ id: d.id, text: d.text, meta: d.meta, score: d.embedding ? cosine(qEmb, d.embedding) : 0 }));
+      const scored = docs.map(d => ({ id: d.id, text: d.text, meta: d.meta, score: cosine(qEmb, toFloats(d.embedding)) }));
       scored.sort((a,b) => b.score - a.score);
       results = scored.slice(0, k);
     }
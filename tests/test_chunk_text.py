@@ -0,0 +1,50 @@
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from chunking import chunk_text  # noqa: E402
+
+WORDS = [f"w{i:03d}" for i in range(400)]
+TEXT = " ".join(WORDS)
+
+
+def shared_length(left: str, right: str) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``."""
+    for n in range(min(len(left), len(right)), 0, -1):
+        if left.endswith(right[:n]):
+            return n
+    return 0
+
+
+def test_short_text_is_single_chunk():
+    assert chunk_text("  hello world  ", chunk_size=100, overlap=20) == ["hello world"]
+
+
+def test_consecutive_chunks_overlap_by_about_overlap():
+    chunks = chunk_text(TEXT, chunk_size=100, overlap=30)
+    assert len(chunks) > 1
+    for left, right in zip(chunks, chunks[1:]):
+        # snapping forward to a word start may give up at most one word (+ space)
+        assert 30 - 5 <= shared_length(left, right) <= 30
+
+
+def test_chunks_respect_size_and_start_on_word_boundary():
+    chunks = chunk_text(TEXT, chunk_size=100, overlap=30)
+    words = set(WORDS)
+    for chunk in chunks:
+        assert len(chunk) <= 100
+        assert chunk.split()[0] in words
+        assert chunk.split()[-1] in words
+
+
+def test_always_terminates_and_covers_the_end():
+    rng = random.Random(0)
+    for _ in range(500):
+        s = "".join(rng.choice("ab  \n") for _ in range(rng.randint(1, 2000)))
+        size = rng.randint(5, 300)
+        overlap = rng.randint(0, size + 10)  # including overlap >= chunk_size
+        chunks = chunk_text(s, chunk_size=size, overlap=overlap)
+        assert all(len(c) <= size for c in chunks)
+        assert s.strip().endswith(chunks[-1])
@@ -0,0 +1,82 @@
+import math
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# api/main.py validates these at import time; no connection is made until a query runs
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "api"))
+
+from main import QueryCache  # noqa: E402
+
+
+def at_angle(cos: float):
+    """2-d unit vector whose cosine with [1, 0] is ``cos``."""
+    return [cos, math.sqrt(1.0 - cos * cos)]
+
+
+def test_exact_hit_returns_stored_embedding():
+    cache = QueryCache(maxsize=4, threshold=0.97)
+    emb = [1.0, 0.0]
+    cache.put("hello", emb, 4, {"answer": "a"})
+    assert cache.embedding("hello") is emb
+    assert cache.embedding("other") is None
+
+
+def test_semantic_hit_needs_same_k_and_threshold():
+    cache = QueryCache(maxsize=4, threshold=0.97)
+    response = {"answer": "a"}
+    cache.put("hello", [1.0, 0.0], 4, response)
+    assert cache.similar(at_angle(0.98), 4) is response
+    assert cache.similar(at_angle(0.98), 3) is None
+    assert cache.similar(at_angle(0.90), 4) is None
+
+
+def test_eviction_drops_least_hit_entry():
+    cache = QueryCache(maxsize=2, threshold=0.97)
+    cache.put("a", [1.0, 0.0], 4, {"answer": "a"})
+    cache.put("b", [0.0, 1.0], 4, {"answer": "b"})
+    cache.embedding("a")  # one hit for "a"; "b" has none
+    cache.put("c", at_angle(0.5), 4, {"answer": "c"})
+    assert set(cache.slots) == {"a", "c"}
+    assert cache.embedding("b") is None
+    assert cache.similar([0.0, 1.0], 4) is None
+
+
+def test_eviction_breaks_ties_by_recency():
+    cache = QueryCache(maxsize=2, threshold=0.97)
+    cache.put("a", [1.0, 0.0], 4, {"answer": "a"})
+    cache.put("b", [0.0, 1.0], 4, {"answer": "b"})
+    cache.put("c", at_angle(0.5), 4, {"answer": "c"})
+    assert set(cache.slots) == {"b", "c"}
+
+
+def test_clear_resets_everything():
+    cache = QueryCache(maxsize=2, threshold=0.97)
+    cache.put("a", [1.0, 0.0], 4, {"answer": "a"})
+    cache.clear()
+    assert cache.slots == {}
+    assert cache.entries == [None, None]
+    assert cache.matrix is None
+    assert not cache.ks.any()
+    assert cache.embedding("a") is None
+    assert cache.similar([1.0, 0.0], 4) is None
+
+
+def test_dimension_change_resets_cache():
+    cache = QueryCache(maxsize=2, threshold=0.97)
+    cache.put("a", [1.0, 0.0], 4, {"answer": "a"})
+    cache.put("b", [1.0, 0.0, 0.0], 4, {"answer": "b"})
+    assert set(cache.slots) == {"b"}
+    assert cache.matrix.shape == (2, 3)
+    assert np.allclose(cache.matrix[cache.slots["b"]], [1.0, 0.0, 0.0])
+
+
+def test_semantic_lookup_can_exclude_the_query_itself():
+    cache = QueryCache(maxsize=4, threshold=0.97)
+    cache.put("hello", [1.0, 0.0], 4, {"answer": "a"})
+    assert cache.similar([1.0, 0.0], 4, exclude="hello") is None
+    assert cache.similar([1.0, 0.0], 4, exclude="other") == {"answer": "a"}